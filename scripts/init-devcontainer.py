@@ -7,23 +7,77 @@ This script runs on the HOST machine before the DevContainer starts.
 It ensures WORKSPACE_NAME and other variables are properly configured.
 """
 
+import functools
 import os
+import re
 import sys
 import json
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
+
+# Paths are resolved once at import, relative to the .devcontainer directory
+DEVCONTAINER_DIR = Path(__file__).parent.resolve().parent
+ENV_PATH = DEVCONTAINER_DIR / '.env'
+TEMPLATE_PATH = DEVCONTAINER_DIR / 'devcontainer.template.json'
+OUTPUT_PATH = DEVCONTAINER_DIR / 'devcontainer.json'
 
 class Colors:
-    """ANSI color codes for terminal output"""
-    GREEN = '\033[0;32m'
-    YELLOW = '\033[1;33m'
-    BLUE = '\033[0;34m'
-    RED = '\033[0;31m'
-    NC = '\033[0m'  # No Color
-
-def log(message: str, color: str = Colors.NC):
+    """ANSI color codes for terminal output, pre-encoded for sys.stdout.buffer"""
+    GREEN = b'\033[0;32m'
+    YELLOW = b'\033[1;33m'
+    BLUE = b'\033[0;34m'
+    RED = b'\033[0;31m'
+    NC = b'\033[0m'  # No Color
+
+# Appended to every log line: reset color, then newline
+_LOG_LINE_END = Colors.NC + b'\n'
+
+# One match per non-blank, non-comment line of a .env file: either
+# KEY=value (groups 1 and 2, surrounding whitespace stripped) or an
+# invalid line without '=' (group 3)
+_ENV_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:((?:[^#=\s][^=\n]*?)?)[^\S\n]*=[^\S\n]*(.*?)|(?!#)(\S.*?))[^\S\n]*$',
+    re.MULTILINE,
+)
+
+# Template placeholders look like __UPPER_SNAKE_CASE__
+_PLACEHOLDER_RE = re.compile(r'__([A-Z][A-Z0-9_]*?)__')
+
+# WORKSPACE_NAME must be usable as a Docker / directory name
+_WORKSPACE_NAME_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# Top-level keys devcontainer.json must contain
+_REQUIRED_FIELDS = frozenset({'name', 'dockerComposeFile', 'service', 'workspaceFolder'})
+
+def _encode(text: str) -> bytes:
+    """Encode text for stdout, replacing characters the console cannot show"""
+    return text.encode(sys.stdout.encoding or 'utf-8', 'replace')
+
+def log(message: str, color: bytes = Colors.NC):
     """Print colored log message"""
-    print(f"{color}{message}{Colors.NC}")
+    sys.stdout.buffer.write(color + _encode(message) + _LOG_LINE_END)
+
+def log_value(name: str, value: str):
+    """Print an indented 'NAME: value' line with the value highlighted"""
+    sys.stdout.buffer.write(
+        Colors.NC + _encode(f"  {name}: ") + Colors.BLUE + _encode(value) + Colors.NC + _LOG_LINE_END
+    )
+
+def _colored_lines(color: bytes, *lines: str) -> bytes:
+    """Pre-render ASCII lines exactly as log() would print them"""
+    return b''.join(color + line.encode('ascii') + _LOG_LINE_END for line in lines)
+
+# Static banner and trailer of main(), each emitted with a single write
+_HEADER = (
+    _colored_lines(Colors.BLUE, "=" * 60, "Diamonds DevContainer Initialization", "=" * 60)
+    + _colored_lines(Colors.NC, "")
+)
+_FOOTER = (
+    _colored_lines(Colors.GREEN, "=" * 60, "Initialization complete!", "=" * 60)
+    + _colored_lines(Colors.NC, "")
+    + _colored_lines(Colors.BLUE, "The DevContainer will now start with your configured settings.")
+    + _colored_lines(Colors.NC, "")
+)
 
 def load_env_file(env_path: Path) -> Dict[str, str]:
     """
@@ -37,44 +91,34 @@ def load_env_file(env_path: Path) -> Dict[str, str]:
     """
     env_vars = {}
     
-    if not env_path.exists():
+    try:
+        text = env_path.read_text(encoding='utf-8')
+    except FileNotFoundError:
         log(f"Warning: .env file not found at {env_path}", Colors.YELLOW)
         log("Creating default .env file...", Colors.BLUE)
-        create_default_env(env_path)
-        
-    try:
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                    
-                # Parse key=value
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Remove quotes if present
-                    if value.startswith('"') and value.endswith('"'):
-                        value = value[1:-1]
-                    elif value.startswith("'") and value.endswith("'"):
-                        value = value[1:-1]
-                    
-                    env_vars[key] = value
-                else:
-                    log(f"Warning: Invalid line {line_num} in .env: {line}", Colors.YELLOW)
-                    
-    except Exception as e:
+        text = create_default_env(env_path)
+    except (OSError, UnicodeDecodeError) as e:
         log(f"Error reading .env file: {e}", Colors.RED)
         sys.exit(1)
+    
+    for match in _ENV_LINE_RE.finditer(text):
+        key, value, invalid = match.groups()
+        
+        if invalid is not None:
+            line_num = text.count('\n', 0, match.start()) + 1
+            log(f"Warning: Invalid line {line_num} in .env: {invalid}", Colors.YELLOW)
+            continue
+        
+        # Remove matching quotes if present
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+            value = value[1:-1]
+        
+        env_vars[key] = value
         
     return env_vars
 
-def create_default_env(env_path: Path):
-    """Create a default .env file with standard values"""
+def create_default_env(env_path: Path) -> str:
+    """Create a default .env file with standard values and return its content"""
     default_content = """# Diamonds DevContainer Configuration
 # Generated automatically - customize as needed
 
@@ -96,33 +140,79 @@ DOC_PORT=8081
     
     try:
         env_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(env_path, 'w', encoding='utf-8') as f:
-            f.write(default_content)
+        env_path.write_text(default_content, encoding='utf-8')
         log(f"✓ Created default .env file at {env_path}", Colors.GREEN)
-    except Exception as e:
+    except OSError as e:
         log(f"Error creating default .env: {e}", Colors.RED)
         sys.exit(1)
+    
+    return default_content
+
+@functools.lru_cache(maxsize=4)
+def load_template(template_path: str, mtime: float) -> Any:
+    """
+    Load and parse the devcontainer template
+    
+    Results are cached per (path, mtime) so repeated generations in the
+    same process reuse the parsed tree until the template changes on disk.
+    The returned tree is shared and must not be mutated.
+    
+    Args:
+        template_path: Path to devcontainer.template.json
+        mtime: Modification time of the template, used as cache key
+        
+    Returns:
+        Parsed template JSON
+    """
+    with open(template_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def substitute_placeholders(node: Any, subs: Dict[str, str]) -> Any:
+    """
+    Recursively replace __PLACEHOLDER__ markers in a parsed JSON tree
+    
+    Args:
+        node: Parsed JSON value (dict, list, string or other scalar)
+        subs: Mapping of placeholder names to replacement values
+        
+    Returns:
+        A copy of the tree with placeholders replaced in all strings
+    """
+    if isinstance(node, str):
+        return _PLACEHOLDER_RE.sub(lambda m: subs.get(m.group(1), m.group(0)), node)
+    if isinstance(node, dict):
+        return {
+            substitute_placeholders(key, subs): substitute_placeholders(value, subs)
+            for key, value in node.items()
+        }
+    if isinstance(node, list):
+        return [substitute_placeholders(item, subs) for item in node]
+    return node
 
 def generate_devcontainer(
     template_path: Path,
     output_path: Path,
     env_vars: Dict[str, str]
-) -> None:
+) -> Dict[str, Any]:
     """
     Generate devcontainer.json from template
     
     Args:
         template_path: Path to devcontainer.template.json
         output_path: Path where devcontainer.json will be written
-        env_vars: Dictionary of environment variables to substitute
+        env_vars: Dictionary of environment variables to substitute;
+            missing defaults are filled in place
+        
+    Returns:
+        The generated configuration as written to output_path
     """
-    # Get values with defaults
-    workspace_name = env_vars.get('WORKSPACE_NAME', 'diamonds_project')
-    diamond_name = env_vars.get('DIAMOND_NAME', 'ExampleDiamond')
-    vault_port = env_vars.get('VAULT_PORT', '8201')
+    # Get values, storing defaults so they are substituted and exported too
+    workspace_name = env_vars.setdefault('WORKSPACE_NAME', 'diamonds_project')
+    diamond_name = env_vars.setdefault('DIAMOND_NAME', 'ExampleDiamond')
+    vault_port = env_vars.setdefault('VAULT_PORT', '8201')
     
     # Validate workspace name (must be valid for Docker)
-    if not workspace_name.replace('_', '').replace('-', '').isalnum():
+    if not _WORKSPACE_NAME_RE.fullmatch(workspace_name):
         log(f"Error: Invalid WORKSPACE_NAME '{workspace_name}'", Colors.RED)
         log("WORKSPACE_NAME must contain only letters, numbers, underscores, and hyphens", Colors.YELLOW)
         sys.exit(1)
@@ -133,113 +223,99 @@ def generate_devcontainer(
         sys.exit(1)
     
     try:
-        # Read template
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = f.read()
+        # Parse template once; substituting into string values keeps the
+        # output valid JSON by construction
+        template = load_template(str(template_path), template_path.stat().st_mtime)
         
-        # Replace placeholders
-        output = template
-        output = output.replace('__WORKSPACE_NAME__', workspace_name)
-        output = output.replace('__DIAMOND_NAME__', diamond_name)
-        output = output.replace('__VAULT_PORT__', vault_port)
+        # Replace placeholders; any .env key can be used as a placeholder,
+        # unknown placeholders are left untouched
+        config = substitute_placeholders(template, env_vars)
+        output = json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8')
         
-        # Validate JSON
+        # Leave an identical file untouched so its mtime does not trigger
+        # container rebuilds or editor reloads
         try:
-            json.loads(output)
-        except json.JSONDecodeError as e:
-            log(f"Error: Generated JSON is invalid: {e}", Colors.RED)
-            sys.exit(1)
-        
-        # Write output
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(output)
+            unchanged = output_path.read_bytes() == output
+        except FileNotFoundError:
+            unchanged = False
         
-        log(f"✓ Generated devcontainer.json", Colors.GREEN)
-        log(f"  WORKSPACE_NAME: {Colors.BLUE}{workspace_name}{Colors.NC}")
-        log(f"  DIAMOND_NAME: {Colors.BLUE}{diamond_name}{Colors.NC}")
-        log(f"  VAULT_PORT: {Colors.BLUE}{vault_port}{Colors.NC}")
+        if unchanged:
+            log(f"✓ devcontainer.json is up to date", Colors.GREEN)
+        else:
+            # Write to a temporary file and rename it over the target so
+            # readers never see a partially written devcontainer.json
+            tmp_path = output_path.with_name(output_path.name + '.tmp')
+            try:
+                tmp_path.write_bytes(output)
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            log(f"✓ Generated devcontainer.json", Colors.GREEN)
+        log_value("WORKSPACE_NAME", workspace_name)
+        log_value("DIAMOND_NAME", diamond_name)
+        log_value("VAULT_PORT", vault_port)
         
-    except Exception as e:
+    except json.JSONDecodeError as e:
+        log(f"Error: Template is not valid JSON: {e}", Colors.RED)
+        sys.exit(1)
+    except (OSError, UnicodeDecodeError) as e:
         log(f"Error generating devcontainer.json: {e}", Colors.RED)
         sys.exit(1)
     
-    # Also set environment variables for current process
+    # Also set environment variables for current process, together with all
+    # other variables from .env, in a single batch
     # This makes them available to VS Code via ${localEnv:WORKSPACE_NAME}
-    os.environ['WORKSPACE_NAME'] = workspace_name
-    os.environ['DIAMOND_NAME'] = diamond_name
-    os.environ['VAULT_PORT'] = vault_port
+    os.environ.update(env_vars)
     
-    # Export all other variables from .env as well
-    for key, value in env_vars.items():
-        os.environ[key] = value
+    return config
 
-def verify_generated_config(output_path: Path) -> bool:
+def verify_generated_config(config: Dict[str, Any]) -> bool:
     """
-    Verify the generated devcontainer.json is valid
+    Verify the generated devcontainer configuration is valid
     
     Args:
-        output_path: Path to generated devcontainer.json
+        config: Generated configuration returned by generate_devcontainer
         
     Returns:
         True if valid, False otherwise
     """
-    try:
-        with open(output_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        # Check required fields
-        required_fields = ['name', 'dockerComposeFile', 'service', 'workspaceFolder']
-        for field in required_fields:
-            if field not in config:
-                log(f"Warning: Missing required field '{field}' in generated config", Colors.YELLOW)
-                return False
-        
-        return True
-        
-    except Exception as e:
-        log(f"Error verifying generated config: {e}", Colors.RED)
+    # Check required fields
+    missing = _REQUIRED_FIELDS - config.keys()
+    if missing:
+        fields = ', '.join(f"'{field}'" for field in sorted(missing))
+        log(f"Warning: Missing required field(s) {fields} in generated config", Colors.YELLOW)
         return False
+    
+    return True
 
 def main():
     """Main entry point"""
-    # Determine paths
-    script_dir = Path(__file__).parent.resolve()
-    devcontainer_dir = script_dir.parent
-    
-    env_path = devcontainer_dir / '.env'
-    template_path = devcontainer_dir / 'devcontainer.template.json'
-    output_path = devcontainer_dir / 'devcontainer.json'
-    
-    log("=" * 60, Colors.BLUE)
-    log("Diamonds DevContainer Initialization", Colors.BLUE)
-    log("=" * 60, Colors.BLUE)
-    log("")
+    sys.stdout.buffer.write(_HEADER)
     
     # Load environment variables
     log("Loading environment variables from .env...", Colors.BLUE)
-    env_vars = load_env_file(env_path)
+    env_vars = load_env_file(ENV_PATH)
     log(f"✓ Loaded {len(env_vars)} variables", Colors.GREEN)
     log("")
     
     # Generate devcontainer.json
     log("Generating devcontainer.json from template...", Colors.BLUE)
-    generate_devcontainer(template_path, output_path, env_vars)
+    config = generate_devcontainer(TEMPLATE_PATH, OUTPUT_PATH, env_vars)
     log("")
     
     # Verify generated config
     log("Verifying generated configuration...", Colors.BLUE)
-    if verify_generated_config(output_path):
+    if verify_generated_config(config):
         log("✓ Configuration is valid", Colors.GREEN)
     else:
         log("⚠ Configuration may have issues", Colors.YELLOW)
     log("")
     
-    log("=" * 60, Colors.GREEN)
-    log("Initialization complete!", Colors.GREEN)
-    log("=" * 60, Colors.GREEN)
-    log("")
-    log("The DevContainer will now start with your configured settings.", Colors.BLUE)
-    log("")
+    sys.stdout.buffer.write(_FOOTER)
+    # log() writes to the block-buffered sys.stdout.buffer; flush once here.
+    # sys.exit on error paths still flushes on interpreter shutdown
+    sys.stdout.flush()
 
 if __name__ == '__main__':
     try:
@@ -249,6 +325,7 @@ if __name__ == '__main__':
         sys.exit(1)
     except Exception as e:
         log(f"\n\nUnexpected error: {e}", Colors.RED)
+        sys.stdout.flush()
         import traceback
         traceback.print_exc()
         sys.exit(1)
\ No newline at end of file